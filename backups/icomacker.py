@@ -1,6 +1,10 @@
 # create_icon.py
 from PIL import Image
 
-# Открываем PNG (должен быть 256x256 или больше)
-img = Image.open("timetracker.png")
-img.save("app.ico", format='ICO', sizes=[(16,16), (32,32), (48,48), (256,256)])
\ No newline at end of file
+SIZES = [(16, 16), (32, 32), (48, 48), (256, 256)]
+
+# Открываем PNG (должен быть 256x256 или больше) и декодируем один раз
+base = Image.open("timetracker.png").convert("RGBA")
+# Уменьшаем сами с LANCZOS, чтобы мелкие размеры иконки не были размытыми
+images = [base.resize(size, Image.LANCZOS) for size in SIZES]
+images[-1].save("app.ico", format='ICO', sizes=SIZES, append_images=images[:-1])
@@ -12,28 +12,30 @@ Features:
 - Backup support
 """
 
+import importlib
 import os
 import sqlite3
 from datetime import datetime, date, timedelta
 import shutil
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 
-try:
-    import ttkbootstrap as tb
-    USE_BOOTSTRAP = True
-except Exception:
-    USE_BOOTSTRAP = False
+# ttkbootstrap, tkcalendar и pandas импортируются при первом использовании:
+# pandas с numpy заметно замедляют запуск, а нужны только для экспорта
+def _lazy_import(name):
+    try:
+        return importlib.import_module(name)
+    except Exception:
+        return None
 
-try:
-    from tkcalendar import DateEntry
-except Exception:
-    raise SystemExit("Please install tkcalendar: pip install tkcalendar")
+_pd = None
 
-try:
-    import pandas as pd
-except Exception:
-    pd = None
+def _pandas():
+    global _pd
+    if _pd is None:
+        _pd = _lazy_import('pandas')
+    return _pd
 
 DB_FILE = "time_tracker_old.db"
 BACKUP_DIR = ""
@@ -56,6 +58,23 @@ CREATE TABLE IF NOT EXISTS entries (
 );
 """
 
+# Часы по задачам за дату — одна строка на задачу
+SUMMARY_SQL = """
+SELECT t.name AS Task, t.w AS W, ROUND(SUM(e.duration_h), 2) AS Duration_h
+FROM entries e JOIN tasks t ON e.task_id=t.id
+WHERE e.date_key=?
+GROUP BY t.id
+ORDER BY t.w DESC, t.name
+"""
+
+def _now_iso():
+    """Текущее время в ISO без микросекунд — для длительностей в часах они не нужны"""
+    return datetime.now().isoformat(timespec='seconds')
+
+def _iso_seconds(s):
+    """Секунды от начала суток для строки ISO 'YYYY-MM-DDTHH:MM:SS...'"""
+    return int(s[11:13]) * 3600 + int(s[14:16]) * 60 + int(s[17:19])
+
 class Storage:
     def __init__(self, path=DB_FILE):
         init_needed = not os.path.exists(path)
@@ -79,10 +98,10 @@ class Storage:
 
     def list_tasks(self):
         cur = self.conn.execute("SELECT * FROM tasks ORDER BY w DESC, name")
-        return [dict(r) for r in cur.fetchall()]
+        return cur.fetchall()
 
     def start_entry(self, task_id, start_ts=None):
-        start_ts = start_ts or datetime.now().isoformat()
+        start_ts = start_ts or _now_iso()
         date_key = start_ts[:10]
         cur = self.conn.cursor()
         cur.execute("INSERT INTO entries (task_id, start_ts, date_key) VALUES (?,?,?)",
@@ -91,15 +110,17 @@ class Storage:
         return cur.lastrowid
 
     def stop_entry(self, entry_id, end_ts=None):
-        end_ts = end_ts or datetime.now().isoformat()
+        end_ts = end_ts or _now_iso()
         cur = self.conn.cursor()
         cur.execute("SELECT start_ts FROM entries WHERE id=?", (entry_id,))
         r = cur.fetchone()
         if not r:
             return False
-        start = datetime.fromisoformat(r['start_ts'])
-        end = datetime.fromisoformat(end_ts)
-        dur = (end - start).total_seconds() / 3600.0
+        start_ts = r['start_ts']
+        if len(start_ts) >= 19 and len(end_ts) >= 19 and start_ts[:10] == end_ts[:10]:
+            dur = (_iso_seconds(end_ts) - _iso_seconds(start_ts)) / 3600.0
+        else:
+            dur = (datetime.fromisoformat(end_ts) - datetime.fromisoformat(start_ts)).total_seconds() / 3600.0
         cur.execute("UPDATE entries SET end_ts=?, duration_h=? WHERE id=?",
                     (end_ts, round(dur, 2), entry_id))
         self.conn.commit()
@@ -109,7 +130,7 @@ class Storage:
         cur = self.conn.execute(
             "SELECT e.*, t.name as task_name FROM entries e JOIN tasks t ON e.task_id=t.id WHERE e.date_key=? ORDER BY start_ts",
             (date_key,))
-        return [dict(r) for r in cur.fetchall()]
+        return cur.fetchall()
 
     def update_entry(self, entry_id, start_ts, end_ts):
         start = datetime.fromisoformat(start_ts)
@@ -123,37 +144,44 @@ class Storage:
         self.conn.execute("DELETE FROM entries WHERE id=?", (entry_id,))
         self.conn.commit()
 
+    def summary_for_date(self, date_key):
+        cur = self.conn.execute(SUMMARY_SQL, (date_key,))
+        return cur.fetchall()
+
+    def total_for_date(self, date_key):
+        cur = self.conn.execute("SELECT ROUND(SUM(duration_h), 2) FROM entries WHERE date_key=?",
+                                (date_key,))
+        return cur.fetchone()[0] or 0
+
     def export_date_to_df(self, date_key):
-        rows = self.list_entries_for_date(date_key)
-        if not rows:
+        pd = _pandas()
+        if pd is None:
             return None
-        data = []
-        for r in rows:
-            data.append({
-                'Task': r['task_name'],
-                'Start': r['start_ts'],
-                'End': r['end_ts'] or '',
-                'Duration_h': r['duration_h']
-            })
-        df = pd.DataFrame(data)
-        summary = df.groupby('Task', as_index=False)['Duration_h'].sum()
-        total = pd.DataFrame([{'Task': 'Total', 'Duration_h': summary['Duration_h'].sum()}])
-        return pd.concat([summary, total], ignore_index=True)
+        # pandas читает курсор сам, без промежуточного списка строк
+        df = pd.read_sql_query(SUMMARY_SQL, self.conn, params=(date_key,))
+        if df.empty:
+            return None
+        df.loc[len(df)] = ['Total', '', self.total_for_date(date_key)]
+        return df
 
 class TimeTrackerUI:
     def __init__(self, root):
         self.root = root
         self.storage = Storage()
         self.selected_date = date.today()
+        self._rows = {}  # iid строки -> показанные значения
         self._setup_ui()
         self._refresh()
 
     def _setup_ui(self):
+        tkcalendar = _lazy_import('tkcalendar')
+        if tkcalendar is None:
+            raise SystemExit("Please install tkcalendar: pip install tkcalendar")
         top = ttk.Frame(self.root)
         top.pack(fill=tk.X, pady=5)
 
         ttk.Label(top, text="Дата:").pack(side=tk.LEFT)
-        self.date_entry = DateEntry(top, date_pattern='yyyy-mm-dd')
+        self.date_entry = tkcalendar.DateEntry(top, date_pattern='yyyy-mm-dd')
         self.date_entry.set_date(self.selected_date)
         self.date_entry.pack(side=tk.LEFT, padx=5)
         ttk.Button(top, text="Обновить", command=self._refresh).pack(side=tk.LEFT, padx=5)
@@ -169,12 +197,24 @@ class TimeTrackerUI:
         self.tree.bind('<Double-1>', self._edit_entry_dialog)
 
     def _refresh(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
         date_key = self.date_entry.get_date().isoformat()
-        rows = self.storage.list_entries_for_date(date_key)
-        for r in rows:
-            self.tree.insert('', 'end', iid=r['id'], values=(r['task_name'], r['start_ts'], r['end_ts'], r['duration_h']))
+        rows = {str(r['id']): (r['task_name'], r['start_ts'], r['end_ts'], r['duration_h'])
+                for r in self.storage.list_entries_for_date(date_key)}
+        # iid строки — id записи, поэтому трогаем только изменившиеся строки
+        stale = [iid for iid in self._rows if iid not in rows]
+        if stale:
+            self.tree.delete(*stale)
+        for iid, values in rows.items():
+            old = self._rows.get(iid)
+            if old is None:
+                self.tree.insert('', 'end', iid=iid, values=values)
+            elif old != values:
+                self.tree.item(iid, values=values)
+        self._rows = rows
+        order = list(rows)
+        if list(self.tree.get_children()) != order:
+            for index, iid in enumerate(order):
+                self.tree.move(iid, '', index)
 
     def _add_task_dialog(self):
         dlg = tk.Toplevel(self.root)
@@ -235,22 +275,19 @@ class TimeTrackerUI:
 
     def _show_report(self):
         date_key = self.date_entry.get_date().isoformat()
-        rows = self.storage.list_entries_for_date(date_key)
-        totals = {}
-        for r in rows:
-            totals[r['task_name']] = totals.get(r['task_name'], 0) + r['duration_h']
+        rows = self.storage.summary_for_date(date_key)
         dlg = tk.Toplevel(self.root)
         dlg.title(f"Отчёт {date_key}")
         tree = ttk.Treeview(dlg, columns=("Task", "Hours"), show='headings')
         tree.heading("Task", text="Task")
         tree.heading("Hours", text="Hours")
         tree.pack(fill=tk.BOTH, expand=True)
-        for t, h in totals.items():
-            tree.insert('', 'end', values=(t, round(h, 2)))
-        tree.insert('', 'end', values=("Total", round(sum(totals.values()), 2)))
+        for r in rows:
+            tree.insert('', 'end', values=(r['Task'], r['Duration_h']))
+        tree.insert('', 'end', values=("Total", self.storage.total_for_date(date_key)))
 
     def _export_excel(self):
-        if pd is None:
+        if _pandas() is None:
             messagebox.showerror("Ошибка", "pandas не установлен")
             return
         date_key = self.date_entry.get_date().isoformat()
@@ -263,11 +300,43 @@ class TimeTrackerUI:
                                             initialfile=f'report_{date_key}.xlsx')
         if not path:
             return
-        df.to_excel(path, index=False)
-        messagebox.showinfo("Экспорт", f"Сохранено: {path}")
+        # Запись файла — в отдельном потоке, окно остается отзывчивым
+        result = {}
+        worker = threading.Thread(target=self._write_excel, args=(df, path, result))
+        worker.start()
+        self._wait_export(worker, path, result)
+
+    @staticmethod
+    def _write_excel(df, path, result):
+        # xlsxwriter быстрее openpyxl; constant_memory с pandas не годится —
+        # to_excel пишет по колонкам, а этот режим сбрасывает строку на диск сразу.
+        # Без xlsxwriter пишем строки потоком через openpyxl в режиме write_only
+        try:
+            if _lazy_import('xlsxwriter') is not None:
+                with _pandas().ExcelWriter(path, engine='xlsxwriter') as writer:
+                    df.to_excel(writer, sheet_name='Report', index=False)
+            else:
+                from openpyxl import Workbook
+                wb = Workbook(write_only=True)
+                ws = wb.create_sheet('Report')
+                ws.append(list(df.columns))
+                for row in df.itertuples(index=False, name=None):
+                    ws.append(row)
+                wb.save(path)
+        except Exception as e:
+            result['error'] = e
+
+    def _wait_export(self, worker, path, result):
+        if worker.is_alive():
+            self.root.after(50, self._wait_export, worker, path, result)
+        elif 'error' in result:
+            messagebox.showerror("Ошибка", str(result['error']))
+        else:
+            messagebox.showinfo("Экспорт", f"Сохранено: {path}")
 
 def main():
-    root = tb.Window(themename='flatly') if USE_BOOTSTRAP else tk.Tk()
+    tb = _lazy_import('ttkbootstrap')
+    root = tb.Window(themename='flatly') if tb else tk.Tk()
     ui = TimeTrackerUI(root)
     root.mainloop()
 
@@ -5,13 +5,60 @@ Time Tracker App (версия с Treeview и кнопками)
 import os
 import sys
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, date
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from tkcalendar import DateEntry  # Добавляем импорт календаря
 import webbrowser  # Добавляем для открытия ссылок
 
 DB_FILE = "time_tracker.db"
+# Версия схемы в PRAGMA user_version; у баз до миграций она 0
+SCHEMA_VERSION = 1
+# Вычисляемые колонки появились в SQLite 3.31, UPDATE ... RETURNING — в 3.35
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+# Индексы создаются и для новых, и для уже существующих баз (см. _migrate)
+INDEXES = """
+-- Покрывающий: строки дня по задаче читаются из индекса, без обращения к таблице
+CREATE INDEX IF NOT EXISTS idx_entries_day
+    ON entries(date_key, task_id, start_ts, end_ts, duration_h, active);
+CREATE INDEX IF NOT EXISTS idx_entries_active ON entries(active) WHERE active=1;
+CREATE INDEX IF NOT EXISTS idx_tasks_order ON tasks(w DESC, name);
+"""
+
+# Агрегат для отчета; фильтр по date_key SQLite проталкивает внутрь GROUP BY
+VIEWS = """
+CREATE VIEW IF NOT EXISTS daily_report AS
+    SELECT
+        e.date_key,
+        t.name as task_name,
+        t.w as important,
+        SUM(e.duration_h) as total_hours,
+        COUNT(e.id) as entries_count
+    FROM entries e
+    JOIN tasks t ON e.task_id = t.id
+    GROUP BY e.date_key, t.id;
+"""
+
+# start_ts/end_ts — unix-время в секундах; шаблон нужен и для миграций.
+# duration_h вычисляется из меток времени и никогда не пишется напрямую.
+# В extra миграция подставляет колонки старых версий (например, note)
+ENTRIES_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    id INTEGER PRIMARY KEY,
+    task_id INTEGER NOT NULL,
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER,
+    duration_h REAL GENERATED ALWAYS AS (COALESCE(ROUND((end_ts - start_ts) / 3600.0, 2), 0)) VIRTUAL,
+    date_key TEXT NOT NULL,
+    active INTEGER DEFAULT 0,
+{extra}    FOREIGN KEY(task_id) REFERENCES tasks(id) ON DELETE CASCADE
+);
+"""
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS tasks (
@@ -19,16 +66,8 @@ CREATE TABLE IF NOT EXISTS tasks (
     name TEXT NOT NULL UNIQUE,
     w INTEGER DEFAULT 0
 );
-CREATE TABLE IF NOT EXISTS entries (
-    id INTEGER PRIMARY KEY,
-    task_id INTEGER NOT NULL,
-    start_ts TEXT NOT NULL,
-    end_ts TEXT,
-    duration_h REAL DEFAULT 0,
-    date_key TEXT NOT NULL,
-    active INTEGER DEFAULT 0,
-    FOREIGN KEY(task_id) REFERENCES tasks(id) ON DELETE CASCADE
-);
+""" + ENTRIES_TABLE.format(name="entries", extra="") + INDEXES + VIEWS + f"""
+PRAGMA user_version={SCHEMA_VERSION};
 """
 
 
@@ -44,43 +83,223 @@ def resource_path(relative_path):
 
 
 class Storage:
+    # Запросы горячих путей хранятся одной строкой на класс, чтобы sqlite3
+    # каждый раз находил уже подготовленный statement в своем кэше
+    SQL_ACTIVE = """
+        SELECT e.id, e.task_id, e.start_ts, e.date_key, t.name as task_name
+        FROM entries e
+        JOIN tasks t ON e.task_id = t.id
+        WHERE e.active=1
+    """
+
+    # Строки дня читаются из покрывающего idx_entries_day; сортируется только один день
+    SQL_ENTRIES_FOR_DATE = """
+        SELECT e.id, e.task_id, e.start_ts, e.end_ts, e.duration_h, e.active,
+               t.name as task_name, t.w as w
+        FROM tasks t
+        JOIN entries e ON e.task_id=t.id AND e.date_key=?
+        ORDER BY t.w DESC, t.name, t.id, e.start_ts
+    """
+
+    # Вместе с записями за дату приходят и активные записи за другие дни.
+    # Вторая ветка вместо OR в условии JOIN: так план не зависит от статистики
+    SQL_TASKS_WITH_ENTRIES = """
+        SELECT t.id AS task_id, t.name AS task_name, t.w,
+               e.id, e.start_ts, e.end_ts, e.duration_h, e.active, e.date_key
+        FROM tasks t
+        LEFT JOIN entries e ON e.task_id=t.id AND e.date_key=?1
+        UNION ALL
+        SELECT t.id, t.name, t.w,
+               e.id, e.start_ts, e.end_ts, e.duration_h, e.active, e.date_key
+        FROM entries e
+        JOIN tasks t ON t.id=e.task_id
+        WHERE e.active=1 AND e.date_key<>?1
+        ORDER BY w DESC, task_name, task_id, start_ts
+    """
+
+    # active=1 в условии: повторный клик по уже остановленной записи ничего не меняет
+    SQL_STOP_ENTRY = ("UPDATE entries SET end_ts=?, active=0 WHERE id=? AND active=1 "
+                      "RETURNING id, end_ts, duration_h")
+    SQL_PAUSE_ALL = "UPDATE entries SET end_ts=?, active=0 WHERE active=1"
+
+    REPORT_CACHE_SIZE = 64
+
+    SQL_DAILY_REPORT = """
+        SELECT task_name, important, total_hours, entries_count
+        FROM daily_report
+        WHERE date_key = ?
+        ORDER BY important DESC, total_hours DESC
+    """
+
     def __init__(self, path=DB_FILE):
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise RuntimeError(
+                "Нужен SQLite {} или новее, установлен {}".format(
+                    ".".join(map(str, MIN_SQLITE_VERSION)), sqlite3.sqlite_version))
+        self.path = path
+        self._local = threading.local()
+        # Соединения у потоков свои, а писатель в каждый момент один
+        # RLock: поток, уже держащий блокировку, может снова вызвать пишущий метод
+        self._write_lock = threading.RLock()
+        # (date_key, max(entries.id) за дату) -> готовый отчет
+        self._report_cache = OrderedDict()
+        self._tasks_cache = None  # список задач; сбрасывается при изменении tasks
+        self._tasks_by_id = None
         init_needed = not os.path.exists(path)
-        self.conn = sqlite3.connect(path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
         if init_needed:
             self.conn.executescript(SCHEMA)
-            self.conn.commit()
         else:
             self._migrate()
 
+    @property
+    def conn(self):
+        """Соединение текущего потока, открывается при первом обращении"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: автокоммит, транзакции открываем явно (transaction).
+            # Кэш statement'ов с запасом, чтобы горячие запросы не вытеснялись
+            conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            # WAL + synchronous=NORMAL: коммит — это дозапись в журнал, без пары fsync.
+            # Если WAL недоступен (например, сетевой диск), оставляем synchronous=FULL
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            if mode.lower() == "wal":
+                conn.execute("PRAGMA synchronous=NORMAL")
+            # Второй поток (фоновое обновление) подождет блокировку, а не упадет с "database is locked"
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA wal_autocheckpoint=1000")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-20000")
+            conn.execute("PRAGMA mmap_size=268435456")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Выполнить несколько команд одной транзакцией (один коммит).
+
+        Вложенный вызов присоединяется к уже открытой транзакции, поэтому
+        add_task, start_entry и другие методы можно собрать в один коммит:
+
+            with storage.transaction():
+                task_id = storage.add_task(name)
+                storage.start_entry(task_id)
+        """
+        conn = self.conn
+        if conn.in_transaction:
+            # Транзакцию этого потока открыл внешний вызов, блокировка уже у него
+            yield conn
+            return
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                # Кэши могли успеть заполниться данными откатанной транзакции
+                self._invalidate_tasks()
+                self._invalidate_reports()
+                raise
+            conn.execute("COMMIT")
+
     def _migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
         cur = self.conn.execute("PRAGMA table_info(entries)")
-        cols = [r[1] for r in cur.fetchall()]
+        cols = {r[1]: r[2] for r in cur.fetchall()}
         if 'active' not in cols:
             self.conn.execute("ALTER TABLE entries ADD COLUMN active INTEGER DEFAULT 0")
-            self.conn.commit()
+        # Раньше foreign_keys включался не для всех соединений, и каскадное удаление
+        # могло не сработать — чистим записи удаленных задач до пересборки таблицы
+        self.conn.execute("DELETE FROM entries WHERE task_id NOT IN (SELECT id FROM tasks)")
+        # Базы до миграций хранят метки времени ISO-строками
+        if cols['start_ts'] == 'TEXT':
+            self._rebuild_entries()
+        self.conn.executescript(INDEXES + VIEWS)
+        self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _rebuild_entries(self):
+        """Пересоздать entries по актуальному ENTRIES_TABLE"""
+        # Тип колонки в SQLite не меняется через ALTER, поэтому пересоздаем таблицу.
+        # Колонки, которых нет в ENTRIES_TABLE, переносим как есть, чтобы не потерять данные
+        known = ("id", "task_id", "start_ts", "end_ts", "duration_h", "date_key", "active")
+        extra_defs, extra_names = "", ""
+        for _, col, col_type, notnull, default, _ in self.conn.execute(
+                "PRAGMA table_info(entries)"):
+            if col in known:
+                continue
+            quoted = '"' + col.replace('"', '""') + '"'
+            extra_defs += f"    {quoted} {col_type}"
+            if notnull:
+                extra_defs += " NOT NULL"
+            if default is not None:
+                extra_defs += f" DEFAULT {default}"
+            extra_defs += ",\n"
+            extra_names += ", " + quoted
+        # Представление ссылается на entries и мешает переименованию — пересоздается в _migrate.
+        # Внешние ключи раньше не проверялись, и копирование старых строк не должно
+        # падать на них; переключать PRAGMA можно только вне транзакции.
+        # ISO-строки хранились в локальном времени, модификатор 'utc' переводит их в UTC
+        self.conn.execute("PRAGMA foreign_keys=OFF")
+        try:
+            self.conn.executescript("BEGIN; DROP VIEW IF EXISTS daily_report;"
+                                    + ENTRIES_TABLE.format(name="entries_new", extra=extra_defs) + f"""
+                INSERT INTO entries_new (id, task_id, start_ts, end_ts, date_key, active{extra_names})
+                    SELECT id, task_id,
+                           CAST(strftime('%s', start_ts, 'utc') AS INTEGER),
+                           CAST(strftime('%s', end_ts, 'utc') AS INTEGER),
+                           date_key, active{extra_names}
+                    FROM entries;
+                DROP TABLE entries;
+                ALTER TABLE entries_new RENAME TO entries;
+                COMMIT;
+            """)
+        except sqlite3.Error:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            raise
+        finally:
+            self.conn.execute("PRAGMA foreign_keys=ON")
+
+    def optimize(self):
+        """Обновить статистику планировщика перед закрытием"""
+        # SQLite сам решает, каким таблицам нужен ANALYZE; обычно это ничего не стоит
+        self.conn.execute("PRAGMA optimize")
 
     def add_task(self, name, w=0):
-        cur = self.conn.cursor()
         try:
-            cur.execute("INSERT INTO tasks (name, w) VALUES (?,?)",
-                        (name.strip(), int(bool(w))))
-            self.conn.commit()
+            with self.transaction() as conn:
+                cur = conn.execute("INSERT INTO tasks (name, w) VALUES (?,?)",
+                                   (name.strip(), int(bool(w))))
+            self._invalidate_tasks()
             return cur.lastrowid
         except sqlite3.IntegrityError:
-            cur.execute("SELECT id FROM tasks WHERE name=?", (name.strip(),))
+            cur = self.conn.execute("SELECT id FROM tasks WHERE name=?", (name.strip(),))
             r = cur.fetchone()
             return r['id'] if r else None
 
+    def bulk_add_tasks(self, rows):
+        """Добавить много задач одной транзакцией; rows — пары (name, w).
+
+        Уже существующие имена пропускаются. Возвращает число добавленных задач.
+        """
+        with self.transaction() as conn:
+            cur = conn.executemany("INSERT OR IGNORE INTO tasks (name, w) VALUES (?,?)",
+                                   ((name.strip(), int(bool(w))) for name, w in rows))
+        self._invalidate_tasks()
+        return cur.rowcount
+
     def get_tasks(self):
         """Получить список всех задач"""
-        cur = self.conn.execute("SELECT * FROM tasks ORDER BY w DESC, name")
-        return [dict(r) for r in cur.fetchall()]
+        return self.list_tasks()
 
     def update_task_w(self, task_id, w):
-        self.conn.execute("UPDATE tasks SET w=? WHERE id=?", (int(bool(w)), task_id))
-        self.conn.commit()
+        with self.transaction() as conn:
+            conn.execute("UPDATE tasks SET w=? WHERE id=?", (int(bool(w)), task_id))
+        self._invalidate_tasks()
+        self._invalidate_reports()
 
     def get_task_id_by_name(self, name):
         """Получить ID задачи по имени"""
@@ -89,153 +308,140 @@ class Storage:
         return r['id'] if r else None
 
     def list_tasks(self):
-        cur = self.conn.execute("SELECT * FROM tasks ORDER BY w DESC, name")
-        return [dict(r) for r in cur.fetchall()]
+        if self._tasks_cache is None:
+            cur = self.conn.execute("SELECT id, name, w FROM tasks ORDER BY w DESC, name")
+            self._tasks_cache = cur.fetchall()
+        return self._tasks_cache
+
+    def tasks_by_id(self):
+        """Задачи по id: {id: строка tasks}"""
+        if self._tasks_by_id is None:
+            self._tasks_by_id = {t['id']: t for t in self.list_tasks()}
+        return self._tasks_by_id
+
+    def _invalidate_tasks(self):
+        self._tasks_cache = None
+        self._tasks_by_id = None
 
     def start_entry(self, task_id, date_key=None):
         """Запустить задачу (не останавливая другие)"""
-        start_ts = datetime.now().isoformat()
-        date_key = date_key or start_ts[:10]
-        cur = self.conn.cursor()
-        cur.execute("INSERT INTO entries (task_id, start_ts, date_key, active) VALUES (?,?,?,1)",
-                    (task_id, start_ts, date_key))
-        self.conn.commit()
+        start_ts = int(time.time())
+        date_key = date_key or date.fromtimestamp(start_ts).isoformat()
+        with self.transaction() as conn:
+            cur = conn.execute("INSERT INTO entries (task_id, start_ts, date_key, active) VALUES (?,?,?,1)",
+                               (task_id, start_ts, date_key))
         return cur.lastrowid
 
     def stop_entry(self, entry_id=None):
-        """Остановить конкретную запись"""
-        end_ts = datetime.now().isoformat()
-        if entry_id:
-            cur = self.conn.execute("SELECT start_ts FROM entries WHERE id=?", (entry_id,))
-            r = cur.fetchone()
-            if not r:
-                return False
-            start_ts = r['start_ts']
-        else:
-            return False  # Теперь нужно явно указывать entry_id
+        """Остановить конкретную запись.
 
-        start = datetime.fromisoformat(start_ts)
-        end = datetime.fromisoformat(end_ts)
-        dur = (end - start).total_seconds() / 3600.0
-        self.conn.execute("UPDATE entries SET end_ts=?, duration_h=?, active=0 WHERE id=?",
-                          (end_ts, round(dur, 2), entry_id))
-        self.conn.commit()
-        return True
+        Возвращает строку (id, end_ts, duration_h) остановленной записи или None.
+        """
+        if not entry_id:
+            return None  # Теперь нужно явно указывать entry_id
+
+        with self.transaction() as conn:
+            stopped = conn.execute(self.SQL_STOP_ENTRY, (int(time.time()), entry_id)).fetchall()
+        self._invalidate_reports()
+        return stopped[0] if stopped else None
 
     def pause_all(self):
         """Остановить все активные задачи"""
-        end_ts = datetime.now().isoformat()
-        cur = self.conn.execute("SELECT id, start_ts FROM entries WHERE active=1")
-        active_entries = cur.fetchall()
-
-        for entry in active_entries:
-            start_ts = entry['start_ts']
-            start = datetime.fromisoformat(start_ts)
-            end = datetime.fromisoformat(end_ts)
-            dur = (end - start).total_seconds() / 3600.0
-            self.conn.execute("UPDATE entries SET end_ts=?, duration_h=?, active=0 WHERE id=?",
-                              (end_ts, round(dur, 2), entry['id']))
-
-        self.conn.commit()
-        return len(active_entries) > 0
+        # duration_h вычисляется самой базой, поэтому хватает одного UPDATE
+        with self.transaction() as conn:
+            cur = conn.execute(self.SQL_PAUSE_ALL, (int(time.time()),))
+        self._invalidate_reports()
+        return cur.rowcount > 0
 
     def get_active_entries(self):
         """Получить все активные записи"""
-        cur = self.conn.execute("""
-            SELECT e.*, t.name as task_name 
-            FROM entries e 
-            JOIN tasks t ON e.task_id = t.id 
-            WHERE e.active=1
-        """)
-        return [dict(r) for r in cur.fetchall()]
+        return self.conn.execute(self.SQL_ACTIVE).fetchall()
 
     def list_entries_for_date(self, date_key):
-        cur = self.conn.execute(
-            """SELECT e.*, t.name as task_name, t.w as w, t.id as task_id
-               FROM entries e
-               JOIN tasks t ON e.task_id=t.id
-               WHERE e.date_key=?
-               ORDER BY t.w DESC, e.start_ts""",
-            (date_key,))
-        return [dict(r) for r in cur.fetchall()]
+        cur = self.conn.execute(self.SQL_ENTRIES_FOR_DATE, (date_key,))
+        return cur.fetchall()
 
     def get_tasks_with_entries_for_date(self, date_key):
-        """Получить все задачи с записями на указанную дату, включая задачи без записей"""
-        # Сначала получаем все задачи
-        tasks = self.list_tasks()
-
-        # Получаем записи на указанную дату
-        entries = self.list_entries_for_date(date_key)
-
-        # Создаем словарь для быстрого доступа к записям по task_id
-        entries_by_task = {}
-        for entry in entries:
-            task_id = entry['task_id']
-            if task_id not in entries_by_task:
-                entries_by_task[task_id] = []
-            entries_by_task[task_id].append(entry)
-
-        # Формируем результат: все задачи с их записями
-        result = []
-        for task in tasks:
-            task_entries = entries_by_task.get(task['id'], [])
-            result.append({
-                'task': task,
-                'entries': task_entries
-            })
+        """Получить все задачи с записями на указанную дату, включая задачи без записей.
 
-        return result
+        Возвращает пару (задачи с записями, все активные записи) — активные
+        записи берутся из того же запроса, отдельный get_active_entries не нужен.
+        """
+        # Один запрос: задачи без записей приходят с e.id = NULL
+        cur = self.conn.execute(self.SQL_TASKS_WITH_ENTRIES, (date_key,))
+
+        # Строки отсортированы по задаче, поэтому группируем за один проход
+        result = []
+        active = []
+        current = None
+        for r in cur:
+            if current is None or current['task']['id'] != r['task_id']:
+                current = {
+                    'task': {'id': r['task_id'], 'name': r['task_name'], 'w': r['w']},
+                    'entries': []
+                }
+                result.append(current)
+            if r['id'] is None:
+                continue
+            if r['active']:
+                active.append(r)
+            if r['date_key'] == date_key:
+                current['entries'].append(r)
+
+        return result, active
 
     def get_daily_report(self, date_key):
         """Получить отчет по задачам за указанную дату"""
-        cur = self.conn.execute("""
-            SELECT 
-                t.name as task_name,
-                t.w as important,
-                SUM(e.duration_h) as total_hours,
-                COUNT(e.id) as entries_count
-            FROM entries e
-            JOIN tasks t ON e.task_id = t.id
-            WHERE e.date_key = ?
-            GROUP BY t.id, t.name, t.w
-            ORDER BY t.w DESC, total_hours DESC
-        """, (date_key,))
-
-        report_data = [dict(r) for r in cur.fetchall()]
+        # Новая запись за дату меняет max(id) и тем самым ключ кэша;
+        # остальные изменения сбрасывают кэш явно (см. _invalidate_reports)
+        cur = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM entries WHERE date_key=?", (date_key,))
+        key = (date_key, cur.fetchone()[0])
+        report = self._report_cache.get(key)
+        if report is not None:
+            self._report_cache.move_to_end(key)
+            return report
+
+        cur = self.conn.execute(self.SQL_DAILY_REPORT, (date_key,))
+
+        report_data = cur.fetchall()
 
         # Получаем общую сумму часов
         total_hours = sum(item['total_hours'] for item in report_data)
 
-        return {
+        report = {
             'date': date_key,
             'tasks': report_data,
             'total_hours': total_hours,
             'tasks_count': len(report_data)
         }
+        self._report_cache[key] = report
+        if len(self._report_cache) > self.REPORT_CACHE_SIZE:
+            self._report_cache.popitem(last=False)
+        return report
+
+    def _invalidate_reports(self):
+        self._report_cache.clear()
 
     def update_entry_time(self, entry_id, start_time, end_time, entry_date):
         """Обновить время начала и окончания записи"""
         try:
             # Преобразуем время в полные timestamp
-            start_ts = f"{entry_date}T{start_time}:00"
-            end_ts = f"{entry_date}T{end_time}:00" if end_time else None
+            start_ts = int(datetime.fromisoformat(f"{entry_date}T{start_time}:00").timestamp())
 
             # Проверяем корректность времени
-            start_dt = datetime.fromisoformat(start_ts)
             if end_time:
-                end_dt = datetime.fromisoformat(end_ts)
-                if end_dt <= start_dt:
+                end_ts = int(datetime.fromisoformat(f"{entry_date}T{end_time}:00").timestamp())
+                if end_ts <= start_ts:
                     return False, "Время окончания должно быть позже времени начала"
-                duration = (end_dt - start_dt).total_seconds() / 3600.0
             else:
                 end_ts = None
-                duration = 0.0
 
-            self.conn.execute(
-                "UPDATE entries SET start_ts=?, end_ts=?, duration_h=?, date_key=? WHERE id=?",
-                (start_ts, end_ts, round(duration, 2), entry_date, entry_id)
-            )
-            self.conn.commit()
+            with self.transaction() as conn:
+                conn.execute(
+                    "UPDATE entries SET start_ts=?, end_ts=?, date_key=? WHERE id=?",
+                    (start_ts, end_ts, entry_date, entry_id)
+                )
+            self._invalidate_reports()
             return True, "Время успешно обновлено"
         except ValueError:
             return False, "Неверный формат времени"
@@ -247,24 +453,35 @@ class Storage:
         return dict(r) if r else None
 
     def add_empty_entry(self, task_id, date_key):
-        self.conn.execute(
-            "INSERT INTO entries (task_id, start_ts, end_ts, duration_h, date_key, active) VALUES (?,?,?,?,?,?)",
-            (task_id, f"{date_key}T00:00:00", f"{date_key}T00:00:00", 0, date_key, 0)
-        )
-        self.conn.commit()
+        midnight = int(datetime.fromisoformat(f"{date_key}T00:00:00").timestamp())
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO entries (task_id, start_ts, end_ts, date_key, active) VALUES (?,?,?,?,?)",
+                (task_id, midnight, midnight, date_key, 0)
+            )
+
+    def add_entries_bulk(self, rows):
+        """Импорт завершённых записей одной транзакцией; rows — (task_id, start_ts, end_ts)"""
+        with self.transaction() as conn:
+            cur = conn.executemany(
+                "INSERT INTO entries (task_id, start_ts, end_ts, date_key, active) VALUES (?,?,?,?,0)",
+                ((task_id, start_ts, end_ts, date.fromtimestamp(start_ts).isoformat())
+                 for task_id, start_ts, end_ts in rows))
+        self._invalidate_reports()
+        return cur.rowcount
 
     def update_entry(self, entry_id, start_ts, end_ts):
-        start = datetime.fromisoformat(start_ts)
-        end = datetime.fromisoformat(end_ts)
-        dur = round((end - start).total_seconds() / 3600.0, 2)
-        self.conn.execute(
-            "UPDATE entries SET start_ts=?, end_ts=?, duration_h=?, date_key=? WHERE id=?",
-            (start_ts, end_ts, dur, start.date().isoformat(), entry_id))
-        self.conn.commit()
+        """Обновить запись; start_ts/end_ts — unix-время в секундах"""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE entries SET start_ts=?, end_ts=?, date_key=? WHERE id=?",
+                (start_ts, end_ts, date.fromtimestamp(start_ts).isoformat(), entry_id))
+        self._invalidate_reports()
 
     def delete_entry(self, entry_id):
-        self.conn.execute("DELETE FROM entries WHERE id=?", (entry_id,))
-        self.conn.commit()
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM entries WHERE id=?", (entry_id,))
+        self._invalidate_reports()
 
 
 class TimeTrackerUI:
@@ -272,8 +489,15 @@ class TimeTrackerUI:
         self.root = root
         self.storage = Storage()
         self.selected_date = date.today()
-        self.active_entries = []  # Список активных записей
+        self._set_active_entries([])  # Список активных записей
         self.w_vars = {}  # Словарь для хранения переменных чекбоксов
+        self._tree_rows = {}  # iid строки дерева -> отображаемые значения
+        self._refresh_pending = False
+        self._date_key_cache = None  # Разобранная дата из календаря до следующей правки поля
+        # Запросы обновления идут в отдельном потоке; устаревшие ответы отбрасываем по номеру
+        self._refresh_executor = ThreadPoolExecutor(max_workers=1)
+        self._refresh_seq = 0
+        self._refresh_in_flight = False  # Ответ рабочего потока еще не применен
         self._setup_ui()
         self._refresh()
         self._update_timer()
@@ -314,7 +538,8 @@ class TimeTrackerUI:
 
         ttk.Label(top, text="Дата:").pack(side=tk.LEFT)
 
-        # Календарь для выбора даты
+        # Календарь для выбора даты (tkcalendar тянет за собой babel, импортируем по месту)
+        from tkcalendar import DateEntry
         self.date_var = tk.StringVar(value=date.today().strftime("%d.%m.%y"))
         self.date_entry = DateEntry(
             top,
@@ -326,6 +551,8 @@ class TimeTrackerUI:
             borderwidth=2
         )
         self.date_entry.pack(side=tk.LEFT, padx=5)
+        # Поле меняется и из календаря, и с клавиатуры — trace ловит оба случая
+        self.date_var.trace_add('write', self._on_date_changed)
 
         ttk.Button(top, text="Обновить", command=self._refresh).pack(side=tk.LEFT, padx=5)
         ttk.Button(top, text="Отчет", command=self._show_report).pack(side=tk.LEFT, padx=5)
@@ -365,6 +592,9 @@ class TimeTrackerUI:
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
+        # Привязываем обработчики кликов
+        self.tree.bind("<Double-1>", self._on_tree_double_click)
+
         # Button frame at the bottom
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=5)
@@ -504,38 +734,74 @@ class TimeTrackerUI:
 
     def _update_timer(self):
         """Обновление таймера для активных задач"""
+        self._render_active()
+        # Часы показываются с точностью 0.01 ч (36 с), чаще обновлять незачем
+        self.root.after(5000, self._update_timer)
+
+    def _render_active(self):
+        """Перерисовать строку статуса и длительность активных строк"""
         if self.active_entries:
-            status_text = "Активные задачи: "
-            active_tasks = []
-            for entry in self.active_entries:
-                start_time = datetime.fromisoformat(entry['start_ts'])
-                current_time = datetime.now()
-                duration = current_time - start_time
-                hours = duration.total_seconds() / 3600
-                active_tasks.append(f"{entry['task_name']} ({hours:.2f} ч)")
-
-            status_text += ", ".join(active_tasks)
-            self.status_label.config(text=status_text)
+            now = time.time()
+            hours = [(now - entry['start_ts']) / 3600 for entry in self.active_entries]
+            self.status_label.config(text=self._status_template.format(*hours))
+            # Длительность активных строк считаем на месте, без запроса к базе
+            for entry, h in zip(self.active_entries, hours):
+                iid = f"e{entry['id']}"
+                if iid in self._tree_rows:
+                    self.tree.set(iid, "Duration", f"{h:.2f}")
         else:
             self.status_label.config(text="Нет активных задач")
 
-        # Обновляем каждую секунду
-        self.root.after(1000, self._update_timer)
+    def _set_active_entries(self, entries):
+        """Запомнить активные записи и заготовить шаблон строки статуса"""
+        self.active_entries = entries
+        # Фигурные скобки в названиях экранируем, чтобы format их не трогал
+        self._status_template = "Активные задачи: " + ", ".join(
+            entry['task_name'].replace("{", "{{").replace("}", "}}") + " ({:.2f} ч)"
+            for entry in entries)
+
+    def _on_date_changed(self, *args):
+        self._date_key_cache = None
 
     def _get_date_key(self):
+        if self._date_key_cache is not None:
+            return self._date_key_cache
         try:
             # Получаем дату из календаря
             selected_date = self.date_entry.get_date()
-            return selected_date.strftime("%Y-%m-%d")
         except Exception:
             return date.today().isoformat()
+        self._date_key_cache = selected_date.strftime("%Y-%m-%d")
+        return self._date_key_cache
 
     def _refresh(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
+        """Запланировать обновление; несколько вызовов подряд дают одно обновление"""
+        if self._refresh_pending:
+            return
+        self._refresh_pending = True
+        self.root.after_idle(self._run_refresh)
+
+    def _run_refresh(self):
+        self._refresh_pending = False
+        self._refresh_seq += 1
+        self._refresh_in_flight = True
+        future = self._refresh_executor.submit(
+            self.storage.get_tasks_with_entries_for_date, self._get_date_key())
+        self._poll_refresh(self._refresh_seq, future)
+
+    def _poll_refresh(self, seq, future):
+        """Дождаться ответа рабочего потока, не блокируя главный цикл Tk"""
+        if seq != self._refresh_seq:
+            return  # Уже запрошено более свежее обновление
+        if not future.done():
+            self.root.after(10, self._poll_refresh, seq, future)
+            return
+        self._refresh_in_flight = False
+        self._apply_refresh(*future.result())
 
+    def _apply_refresh(self, tasks_with_entries, active_entries):
         # Проверяем активные задачи
-        self.active_entries = self.storage.get_active_entries()
+        self._set_active_entries(active_entries)
 
         # Обновляем состояние кнопок
         if self.active_entries:
@@ -543,50 +809,69 @@ class TimeTrackerUI:
         else:
             self.pause_btn.config(state="disabled")
 
-        date_key = self._get_date_key()
-        tasks_with_entries = self.storage.get_tasks_with_entries_for_date(date_key)
+        active_ids = {e['id'] for e in self.active_entries}
 
+        # Собираем строки с устойчивыми iid: "e<id записи>" или "t<id задачи>"
+        rows = []
         for task_data in tasks_with_entries:
             task = task_data['task']
             entries = task_data['entries']
+            task_info = (task['id'], task['name'], task['w'])
 
             if entries:
                 # Если есть записи для этой задачи, показываем их
                 for entry in entries:
-                    start_t = datetime.fromisoformat(entry['start_ts']).strftime('%H:%M')
-                    end_t = datetime.fromisoformat(entry['end_ts']).strftime('%H:%M') if entry['end_ts'] else ''
+                    start_t = datetime.fromtimestamp(entry['start_ts']).strftime('%H:%M')
+                    end_t = datetime.fromtimestamp(entry['end_ts']).strftime('%H:%M') if entry['end_ts'] else ''
                     # Добавляем стрелку для активных задач
-                    is_active = any(active_entry['id'] == entry['id'] for active_entry in self.active_entries)
+                    is_active = entry['id'] in active_ids
                     task_name = ('▶ ' if is_active else '') + task['name']
 
-                    item_id = self.tree.insert("", tk.END, values=(
+                    rows.append((f"e{entry['id']}", (
                         task_name,
                         "✓" if task['w'] else "",
                         start_t,
                         end_t,
-                        entry['duration_h'],
+                        f"{entry['duration_h']:.2f}",
                         f"ID: {entry['id']}"
-                    ))
-
-                    # Сохраняем информацию о задаче
-                    self.w_vars[item_id] = (task['id'], task['name'], task['w'])
-
+                    ), task_info))
             else:
                 # Если нет записей, показываем только задачу
-                item_id = self.tree.insert("", tk.END, values=(
+                rows.append((f"t{task['id']}", (
                     task['name'],
                     "✓" if task['w'] else "",
                     "",
                     "",
                     "",
                     ""
-                ))
-
-                # Сохраняем информацию о задаче
-                self.w_vars[item_id] = (task['id'], task['name'], task['w'])
-
-        # Привязываем обработчики кликов
-        self.tree.bind("<Double-1>", self._on_tree_double_click)
+                ), task_info))
+
+        # Вместо полной перестройки дерева применяем к нему только разницу
+        new_iids = [iid for iid, _, _ in rows]
+        new_set = set(new_iids)
+        stale = [iid for iid in self.tree.get_children() if iid not in new_set]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                self._tree_rows.pop(iid, None)
+
+        self.w_vars = {}
+        for iid, values, task_info in rows:
+            old_values = self._tree_rows.get(iid)
+            if old_values is None:
+                self.tree.insert("", tk.END, iid=iid, values=values)
+            elif old_values != values:
+                self.tree.item(iid, values=values)
+            self._tree_rows[iid] = values
+            # Сохраняем информацию о задаче
+            self.w_vars[iid] = task_info
+
+        if list(self.tree.get_children()) != new_iids:
+            for index, iid in enumerate(new_iids):
+                self.tree.move(iid, "", index)
+
+        # Статус и таймеры новых активных строк показываем сразу, не дожидаясь тика
+        self._render_active()
 
     def _on_tree_double_click(self, event):
         """Обработчик двойного клика по дереву"""
@@ -641,13 +926,13 @@ class TimeTrackerUI:
 
         # Поле для времени начала
         ttk.Label(main_frame, text="Время начала (ЧЧ:ММ):").grid(row=0, column=0, sticky="w", padx=5, pady=5)
-        start_var = tk.StringVar(value=datetime.fromisoformat(entry['start_ts']).strftime('%H:%M'))
+        start_var = tk.StringVar(value=datetime.fromtimestamp(entry['start_ts']).strftime('%H:%M'))
         start_entry = ttk.Entry(main_frame, textvariable=start_var, width=10)
         start_entry.grid(row=0, column=1, padx=5, pady=5)
 
         # Поле для времени окончания
         ttk.Label(main_frame, text="Время окончания (ЧЧ:ММ):").grid(row=1, column=0, sticky="w", padx=5, pady=5)
-        end_value = datetime.fromisoformat(entry['end_ts']).strftime('%H:%M') if entry['end_ts'] else ''
+        end_value = datetime.fromtimestamp(entry['end_ts']).strftime('%H:%M') if entry['end_ts'] else ''
         end_var = tk.StringVar(value=end_value)
         end_entry = ttk.Entry(main_frame, textvariable=end_var, width=10)
         end_entry.grid(row=1, column=1, padx=5, pady=5)
@@ -712,18 +997,12 @@ class TimeTrackerUI:
             messagebox.showwarning("Предупреждение", "Выберите задачу для старта")
             return
 
-        item = self.tree.item(selection[0])
-        values = item['values']
-
-        # Проверяем, есть ли уже активная запись для этой задачи
-        task_name = values[0].replace('▶ ', '').strip()
-
-        # Находим task_id по имени задачи
-        task_id = self.storage.get_task_id_by_name(task_name)
+        # task_id строки уже сохранен в w_vars при обновлении дерева
+        task_id, _, _ = self.w_vars.get(selection[0], (None, None, 0))
 
         if task_id:
             self.storage.start_entry(task_id, self._get_date_key())
-            self.active_entries = self.storage.get_active_entries()
+            # Список активных записей придет вместе с данными обновления
             self._refresh()
 
     def _stop_selected_task(self):
@@ -742,19 +1021,45 @@ class TimeTrackerUI:
             entry_id = int(entry_id_str.split(': ')[1])
             # Проверяем, активна ли эта запись
             if any(entry['id'] == entry_id for entry in self.active_entries):
-                self.storage.stop_entry(entry_id)
-                self.active_entries = self.storage.get_active_entries()
-                self._refresh()
+                stopped = self.storage.stop_entry(entry_id)
+                if stopped and f"e{entry_id}" in self._tree_rows:
+                    self._patch_stopped_row(stopped)
+                else:
+                    self._refresh()
             else:
                 messagebox.showwarning("Предупреждение", "Выбранная задача не активна")
         except (IndexError, ValueError):
             messagebox.showerror("Ошибка", "Не удалось определить ID записи")
 
+    def _patch_stopped_row(self, stopped):
+        """Обновить строку остановленной записи на месте, без перечитывания дня"""
+        iid = f"e{stopped['id']}"
+        values = list(self._tree_rows[iid])
+        values[0] = self.w_vars[iid][1]  # Имя задачи без стрелки активной записи
+        values[3] = datetime.fromtimestamp(stopped['end_ts']).strftime('%H:%M')
+        values[4] = f"{stopped['duration_h']:.2f}"
+        values = tuple(values)
+        self.tree.item(iid, values=values)
+        self._tree_rows[iid] = values
+
+        self._set_active_entries([e for e in self.active_entries if e['id'] != stopped['id']])
+        if not self.active_entries:
+            self.pause_btn.config(state="disabled")
+        self._render_active()
+
+        # Снимок обновления, запущенного до остановки, вернул бы запись в активные:
+        # отбрасываем его и перечитываем день заново
+        if self._refresh_in_flight:
+            self._refresh_seq += 1
+            self._refresh_in_flight = False
+            self._refresh()
+
     def _pause_all_tasks(self):
         """Остановить все активные задачи"""
         if self.active_entries:
             self.storage.pause_all()
-            self.active_entries = []
+            self._set_active_entries([])
+            self._render_active()
             self._refresh()
 
     def _add_task_dialog(self):
@@ -840,8 +1145,14 @@ def main():
     if not icon_set:
         print("Не удалось установить иконку. Проверьте наличие файлов иконок")
 
-    app = TimeTrackerUI(root)
+    try:
+        app = TimeTrackerUI(root)
+    except RuntimeError as e:
+        messagebox.showerror("Ошибка", str(e))
+        root.destroy()
+        return
     root.mainloop()
+    app.storage.optimize()
 
 
 if __name__ == "__main__":